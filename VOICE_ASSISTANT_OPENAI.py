@@ -1,21 +1,31 @@
 import os
-import json
-import base64
+import re
 import asyncio
+import hashlib
 import uvicorn
 import openai
+import httpx
+import orjson
 import tempfile
 import numpy as np
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from pydub import AudioSegment
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import HTMLResponse, FileResponse
 import io
+import wave
+import struct
 import edge_tts
-import requests
-from typing import Optional, Dict, List
+from typing import Optional, List, Tuple
 import time
 import logging
 import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from contextlib import asynccontextmanager
+
+try:
+    import diskcache  # Optional - persists the TTS cache across restarts
+except ImportError:
+    diskcache = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,12 +38,100 @@ if not openai_api_key:
 else:
     openai.api_key = openai_api_key
 
+# Shared async client - keeps TLS connections to OpenAI alive between requests
+openai_client = openai.AsyncOpenAI(
+    api_key=openai_api_key,
+    http_client=httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=32))
+) if openai_api_key else None
+
 # Configuration - Optimized for speed
 USE_WHISPER = True
-OPENAI_MODEL = "gpt-3.5-turbo"
+USE_LOCAL_WHISPER = os.getenv("USE_LOCAL_WHISPER") == "1"  # Batched faster-whisper instead of the OpenAI API
+OPENAI_MODEL = "gpt-4o-mini"  # Faster first token than gpt-3.5-turbo, automatic prompt caching
 MAX_RECORDING_TIME = 10  # Seconds
 RESPONSE_TIMEOUT = 15  # Seconds
 
+# Response cache - skips the LLM (and TTS) for repeated or near-duplicate questions
+EMBEDDING_MODEL = "text-embedding-3-small"
+CACHE_MAX_ENTRIES = 1000
+CACHE_TTL = 24 * 60 * 60  # Seconds
+CACHE_SIMILARITY_THRESHOLD = 0.93  # Cosine similarity for a semantic hit
+
+# Knowledge base folded into the system prompt (question in column A, answer in column C)
+KNOWLEDGE_BASE_PATH = os.getenv(
+    "KNOWLEDGE_BASE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "Merged_File_with_Sheets.xlsx")
+)
+
+# Local Whisper (USE_LOCAL_WHISPER=1)
+LOCAL_WHISPER_MODEL = os.getenv("LOCAL_WHISPER_MODEL", "small")
+LOCAL_WHISPER_DEVICE = os.getenv("LOCAL_WHISPER_DEVICE", "cuda")
+LOCAL_WHISPER_COMPUTE_TYPE = os.getenv(
+    "LOCAL_WHISPER_COMPUTE_TYPE", "int8_float16" if LOCAL_WHISPER_DEVICE == "cuda" else "int8"
+)
+BATCH_MAX_SIZE = 8
+BATCH_MAX_WAIT = 0.04  # Seconds to wait for more requests before running a batch
+BATCH_BUCKETS = (3.0, 7.0, float("inf"))  # Upper bounds (seconds of audio) of the length buckets
+RECORDING_BITRATE = 32000  # bits/s the browser records at, used to estimate clip length
+MAX_RECORDING_BYTES = 1024 * 1024  # Per streamed recording (~4 minutes at RECORDING_BITRATE); more is dropped
+
+# Browser-side voice activity detection - falls back to the volume threshold if the model is missing
+# Both are served from this server, never a CDN - see the README for the pinned versions
+SILERO_VAD_PATH = os.getenv(
+    "SILERO_VAD_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "silero_vad.onnx")  # Silero VAD v5
+)
+ORT_WEB_DIR = os.getenv(
+    "ORT_WEB_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "onnxruntime-web")  # onnxruntime-web dist/
+)
+ORT_WEB_TYPES = {".js": "text/javascript", ".mjs": "text/javascript", ".wasm": "application/wasm"}
+
+def vad_available() -> bool:
+    return os.path.isfile(SILERO_VAD_PATH) and os.path.isfile(os.path.join(ORT_WEB_DIR, "ort.min.js"))
+
+# Text-to-speech
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")  # Where streamed LLM text is cut into TTS sentences
+TTS_VOICE = "en-US-JennyNeural"  # Faster US voice
+TTS_RATE = "+10%"  # Slightly faster speech
+TTS_PITCH = "+0Hz"
+TTS_CACHE_SIZE = 256
+TTS_CACHE_DIR = os.path.join(tempfile.gettempdir(), "tts_cache_mp3")
+
+# Canned replies - synthesized at startup so they never wait on Edge TTS
+# NO_INPUT_REPLY is spoken when Whisper hears nothing in a recording
+NO_INPUT_REPLY = "I didn't catch that. Could you please repeat?"
+WARMUP_PHRASES = [NO_INPUT_REPLY]
+
+def load_faq(path: str) -> str:
+    """Q&A pairs from the knowledge base workbook as prompt text ('' if unavailable)"""
+    try:
+        from openpyxl import load_workbook
+        
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        pairs = []
+        for sheet in workbook.worksheets:
+            for row in sheet.iter_rows(min_row=2, max_col=3, values_only=True):  # Row 1 is the header
+                if len(row) == 3 and row[0] and row[2]:
+                    pairs.append(f"Q: {str(row[0]).strip()}\nA: {str(row[2]).strip()}")
+        workbook.close()
+        logger.info(f"Loaded {len(pairs)} FAQ entries into the system prompt")
+        return "\n\n".join(pairs)
+    
+    except Exception as e:
+        logger.warning(f"Could not load knowledge base {path}: {e}")
+        return ""
+
+# Static prompt - built once and sent token-for-token identical as the first message of every
+# request, so OpenAI's automatic prompt caching can reuse it (only prefixes of 1024+ tokens are cached).
+# With the FAQ it is ~4k prompt tokens per request: cached tokens are discounted, not free.
+SYSTEM_PROMPT = """You are BigShip's helpful voice assistant. Give short, clear answers (1-2 sentences max) about shipping and logistics."""
+_faq = load_faq(KNOWLEDGE_BASE_PATH)
+if _faq:
+    SYSTEM_PROMPT += "\n\nUse these BigShip FAQ answers when they are relevant:\n\n" + _faq
+else:
+    SYSTEM_PROMPT += " Key info: BigShip offers 40% savings, covers 29,000+ pin codes, partners with major couriers, provides real-time tracking."
+
 # Initialize FastAPI
 app = FastAPI(
     title="BigShip Voice Assistant - Optimized",
@@ -41,141 +139,508 @@ app = FastAPI(
     version="7.0.0"
 )
 
-# Global state
-conversation_state = {
-    "is_listening": False,
-    "is_processing": False,
-    "is_speaking": False,
-    "current_websocket": None,
-    "performance_stats": {
-        "transcription_time": 0,
-        "response_time": 0,
-        "tts_time": 0,
-        "total_time": 0
-    }
-}
+# Performance monitoring - one monitor per request so concurrent sessions don't overwrite each other
+@dataclass(slots=True)
+class Metrics:
+    transcription_time: float = 0.0
+    response_time: float = 0.0
+    tts_time: float = 0.0
+    cache_hit: bool = False
 
-# Performance monitoring
 class PerformanceMonitor:
     def __init__(self):
-        self.start_time = None
-        self.metrics = {}
+        self.start_time = None  # perf_counter_ns - monotonic, immune to system clock steps
+        self.metrics = Metrics()
         
     def start(self):
-        self.start_time = time.time()
-        self.metrics = {
-            "transcription_time": 0,
-            "response_time": 0,
-            "tts_time": 0
-        }
+        self.start_time = time.perf_counter_ns()
+        self.metrics = Metrics()
         
     def record(self, stage):
-        if self.start_time:
-            elapsed = time.time() - self.start_time
-            self.metrics[stage] = elapsed
-            self.start_time = time.time()
+        if self.start_time is not None:
+            now = time.perf_counter_ns()
+            setattr(self.metrics, stage, (now - self.start_time) / 1e9)
+            self.start_time = now
             
     def get_metrics(self):
-        total = sum(self.metrics.values())
-        return {**self.metrics, "total_time": total}
+        total = self.metrics.transcription_time + self.metrics.response_time + self.metrics.tts_time
+        return {**asdict(self.metrics), "total_time": total}
 
-performance_monitor = PerformanceMonitor()
+# Per-connection state - each websocket gets its own, nothing is shared between users
+class Session:
+    __slots__ = ("ws", "is_processing", "monitor", "codec", "audio_chunks", "audio_size", "audio_dropped")
+    
+    def __init__(self, ws: WebSocket):
+        self.ws = ws
+        self.is_processing = False
+        self.monitor = PerformanceMonitor()
+        self.reset_recording()
+    
+    def reset_recording(self, codec: str = "audio/webm"):
+        self.codec = codec  # Set by the browser's audio_begin message
+        self.audio_chunks = []  # Recording streamed so far, joined on audio_end
+        self.audio_size = 0
+        self.audio_dropped = False  # Went over MAX_RECORDING_BYTES - ignored until the next audio_begin
 
-async def transcribe_audio_openai(audio_data: bytes) -> str:
-    """Optimized transcription with better error handling"""
-    try:
-        logger.info("Starting transcription...")
-        performance_monitor.start()
+# Response cache
+class LLMCache:
+    """Exact + semantic cache of AI responses and their TTS audio"""
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, threshold=CACHE_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.entries = OrderedDict()  # key -> {"response", "audio", "embedding", "created"}
+        self.locks = {}  # key -> [asyncio.Lock, number of holders/waiters]
+        self.hits = 0
+        self.misses = 0
+        self._matrix = None  # Stacked float32 embeddings, rebuilt lazily
+        self._matrix_keys = []
         
-        # Convert webm to wav with optimal settings
-        audio = AudioSegment.from_file(io.BytesIO(audio_data), format="webm")
+    @staticmethod
+    def make_key(text: str) -> str:
+        normalized = " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
         
-        # Optimize audio for Whisper
-        audio = audio.set_frame_rate(16000).set_channels(1)
+    @asynccontextmanager
+    async def lock(self, text: str):
+        """Serialize identical in-flight questions so only the first one hits the LLM"""
+        key = self.make_key(text)
+        holder = self.locks.setdefault(key, [asyncio.Lock(), 0])
+        holder[1] += 1
+        try:
+            async with holder[0]:
+                yield
+        finally:
+            holder[1] -= 1
+            if holder[1] == 0:
+                del self.locks[key]
+                
+    async def lookup(self, text: str):
+        """Return (entry, embedding task); entry is None on a miss, await the task only to store()"""
+        self._evict_expired()
+        key = self.make_key(text)
         
-        # Don't trim silence as it might remove valid speech
-        # Just normalize volume
-        audio = audio.normalize()
+        # Exact hit on the normalized text
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry, None
         
-        if len(audio) < 300:  # Less than 0.3 seconds
-            logger.warning("Audio too short")
-            return ""
+        # The embedding call runs alongside the LLM stream - only wait for it if there is something to compare
+        embedding_task = asyncio.create_task(get_embedding(text))
+        matrix = self._embedding_matrix()
+        if matrix is None:
+            self.misses += 1
+            return None, embedding_task
         
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-            audio.export(tmp.name, format="wav")
-            tmp_path = tmp.name
+        # Semantic hit on the closest cached question
+        embedding = await embedding_task
+        if embedding is not None:
+            scores = matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                hit_key = self._matrix_keys[best]
+                logger.info(f"Semantic cache hit (similarity {scores[best]:.3f})")
+                self.entries.move_to_end(hit_key)
+                self.hits += 1
+                return self.entries[hit_key], embedding_task
         
-        try:
+        self.misses += 1
+        return None, embedding_task
+        
+    def store(self, text: str, embedding, response: str, audio: bytes):
+        key = self.make_key(text)
+        self.entries[key] = {
+            "response": response,
+            "audio": audio,
+            "embedding": embedding,
+            "created": time.time()
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self._matrix = None
+        
+    def get_stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+        
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl
+        expired = [key for key, entry in self.entries.items() if entry["created"] < cutoff]
+        for key in expired:
+            del self.entries[key]
+        if expired:
+            self._matrix = None
+            
+    def _embedding_matrix(self):
+        if self._matrix is None:
+            self._matrix_keys = [key for key, entry in self.entries.items() if entry["embedding"] is not None]
+            if self._matrix_keys:
+                self._matrix = np.stack([self.entries[key]["embedding"] for key in self._matrix_keys])
+        return self._matrix
+
+llm_cache = LLMCache()
+
+# TTS audio cache: sha1(text|voice|rate) -> MP3 bytes, LRU in memory, optionally backed by disk
+_TTS_CACHE = OrderedDict()
+_TTS_DISK_CACHE = diskcache.Cache(TTS_CACHE_DIR) if diskcache else None
+
+def _tts_cache_key(text: str) -> str:
+    return hashlib.sha1(f"{text}|{TTS_VOICE}|{TTS_RATE}".encode("utf-8")).hexdigest()
+
+async def _tts_cache_get(key: str):
+    audio = _TTS_CACHE.get(key)
+    if audio is not None:
+        _TTS_CACHE.move_to_end(key)
+        return audio
+    if _TTS_DISK_CACHE is not None:
+        # diskcache is synchronous SQLite + file IO, keep it off the event loop
+        audio = await asyncio.to_thread(_TTS_DISK_CACHE.get, key)
+        if audio is not None:
+            _tts_cache_put(key, audio, persist=False)
+    return audio
+
+def _tts_cache_put(key: str, audio: bytes, persist: bool = True):
+    _TTS_CACHE[key] = audio
+    _TTS_CACHE.move_to_end(key)
+    if len(_TTS_CACHE) > TTS_CACHE_SIZE:
+        _TTS_CACHE.popitem(last=False)
+    if persist and _TTS_DISK_CACHE is not None:
+        # Write-behind: the reply never waits on the disk
+        _run_in_background(asyncio.to_thread(_TTS_DISK_CACHE.set, key, audio))
+
+# Fire-and-forget tasks need a strong reference until they finish
+_background_tasks = set()
+
+def _run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def pcm16_to_wav(samples: np.ndarray, sample_rate: int = 16000) -> bytes:
+    """Wrap mono int16 PCM in a WAV header - no pydub/ffmpeg round trip"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype(np.int16, copy=False).tobytes())
+    return buffer.getvalue()
+
+# 1 second of 16kHz silence for /api/test-audio, built once
+_SILENT_1S_WAV = pcm16_to_wav(np.zeros(16000, dtype=np.int16))
+
+def _ogg_crc_table():
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+_OGG_CRC_TABLE = _ogg_crc_table()
+
+def _ogg_page(packets: List[bytes], granule: int, serial: int, sequence: int, flags: int = 0) -> bytes:
+    """One Ogg page holding whole packets (RFC 3533)"""
+    lacing = bytearray()
+    for packet in packets:
+        lacing += b"\xff" * (len(packet) // 255) + bytes([len(packet) % 255])
+    page = bytearray(struct.pack("<4sBBqIIIB", b"OggS", 0, flags, granule, serial, sequence, 0, len(lacing)))
+    page += lacing
+    page += b"".join(packets)
+    crc = 0
+    for byte in page:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _OGG_CRC_TABLE[(crc >> 24) ^ byte]
+    page[22:26] = struct.pack("<I", crc)
+    return bytes(page)
+
+def _opus_packet_samples(packet: bytes) -> int:
+    """Samples (at 48kHz) in an Opus packet, read from its TOC byte (RFC 6716 section 3.1)"""
+    config = packet[0] >> 3
+    if config < 12:
+        frame_size = (480, 960, 1920, 2880)[config % 4]  # SILK
+    elif config < 16:
+        frame_size = (480, 960)[config % 2]  # Hybrid
+    else:
+        frame_size = (120, 240, 480, 960)[config % 4]  # CELT
+    code = packet[0] & 3
+    frames = 1 if code == 0 else 2 if code < 3 else packet[1] & 0x3F
+    return frame_size * frames
+
+def opus_packets_to_ogg(packets: List[bytes], sample_rate: int = 16000, pre_skip: int = 312) -> bytes:
+    """Wrap raw mono Opus packets (WebCodecs AudioEncoder output) in an Ogg Opus stream Whisper can read"""
+    serial = 1
+    head = struct.pack("<8sBBHIhB", b"OpusHead", 1, 1, pre_skip, sample_rate, 0, 0)
+    vendor = b"voice-assistant"
+    tags = b"OpusTags" + struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", 0)
+    pages = [_ogg_page([head], 0, serial, 0, flags=0x02), _ogg_page([tags], 0, serial, 1)]
+    
+    group, segments, granule = [], 0, 0
+    for packet in packets:
+        if not packet or (packet[0] & 3 == 3 and len(packet) < 2):
+            continue  # Empty, or a code 3 packet missing its frame count byte
+        needed = len(packet) // 255 + 1
+        if group and segments + needed > 255:
+            pages.append(_ogg_page(group, granule, serial, len(pages)))
+            group, segments = [], 0
+        group.append(packet)
+        segments += needed
+        granule += _opus_packet_samples(packet)
+    pages.append(_ogg_page(group, granule, serial, len(pages), flags=0x04))
+    return b"".join(pages)
+
+# Local Whisper with dynamic batching across concurrent sessions
+def estimate_audio_duration(audio_data: bytes) -> float:
+    """Seconds of audio, read from the WAV header or estimated from the compressed size"""
+    if audio_data[:4] == b"RIFF":
+        byte_rate = int.from_bytes(audio_data[28:32], "little")
+        return max(len(audio_data) - 44, 0) / (byte_rate or 32000)
+    return len(audio_data) * 8 / RECORDING_BITRATE
+
+class WhisperBatcher:
+    """Groups concurrent transcription requests of similar length into one batched faster-whisper call"""
+    def __init__(self, max_batch_size=BATCH_MAX_SIZE, max_wait=BATCH_MAX_WAIT, buckets=BATCH_BUCKETS):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.buckets = buckets
+        self.queues = None  # One queue + worker per length bucket
+        self.workers = []
+        self.model = None
+        self.tokenizer = None
+        self.load_lock = threading.Lock()
+        
+    async def transcribe(self, audio_data: bytes) -> str:
+        if self.queues is None:
+            self.queues = [asyncio.Queue() for _ in self.buckets]
+            self.workers = [asyncio.create_task(self._run(queue)) for queue in self.queues]
+        
+        # Short clips batched with long ones would wait on the longest decode in the batch
+        duration = estimate_audio_duration(audio_data)
+        bucket = next(i for i, limit in enumerate(self.buckets) if duration < limit)
+        
+        future = asyncio.get_running_loop().create_future()
+        await self.queues[bucket].put((audio_data, future))
+        return await future
+        
+    async def _run(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a first request, then up to max_wait for the batch to fill
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                texts = await asyncio.to_thread(self._transcribe_batch, [audio for audio, _ in batch])
+                for (_, future), text in zip(batch, texts):
+                    if future.done():
+                        continue
+                    if isinstance(text, Exception):
+                        future.set_exception(text)  # Only this clip failed to decode
+                    else:
+                        future.set_result(text)
+            except Exception as e:
+                logger.error(f"Local Whisper batch error: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                        
+    def load(self):
+        """Load the model now rather than on the first batch - raises if faster-whisper or the model is unusable"""
+        with self.load_lock:  # Bucket workers may start their first batch at the same time
+            if self.model is None:
+                self._load_model()
+                
+    def _load_model(self):
+        from faster_whisper import WhisperModel
+        from faster_whisper.tokenizer import Tokenizer
+        
+        logger.info(f"Loading local Whisper model '{LOCAL_WHISPER_MODEL}' on {LOCAL_WHISPER_DEVICE}...")
+        self.model = WhisperModel(
+            LOCAL_WHISPER_MODEL,
+            device=LOCAL_WHISPER_DEVICE,
+            compute_type=LOCAL_WHISPER_COMPUTE_TYPE
+        )
+        self.tokenizer = Tokenizer(
+            self.model.hf_tokenizer,
+            self.model.model.is_multilingual,
+            task="transcribe",
+            language="en"
+        )
+        
+    def _transcribe_batch(self, blobs):
+        """Runs in a worker thread: decode, stack mel features to [B, n_mels, 3000], decode in one call.
+        Returns a transcript per blob, or the exception for a blob that could not be decoded."""
+        from faster_whisper.audio import decode_audio, pad_or_trim
+        
+        self.load()
+        
+        # Recordings are capped well below Whisper's 30s window, so each one is a single segment
+        sampling_rate = self.model.feature_extractor.sampling_rate
+        outputs = [None] * len(blobs)
+        decoded, features = [], []
+        for i, blob in enumerate(blobs):
+            # One undecodable upload must not fail the other sessions' clips in the batch
+            try:
+                audio = decode_audio(io.BytesIO(blob), sampling_rate=sampling_rate)
+                features.append(pad_or_trim(self.model.feature_extractor(audio)))
+                decoded.append(i)
+            except Exception as e:
+                logger.error(f"Local Whisper could not decode audio: {e}")
+                outputs[i] = e
+        if not decoded:
+            return outputs
+        
+        encoder_output = self.model.encode(np.stack(features))
+        prompt = list(self.tokenizer.sot_sequence) + [self.tokenizer.no_timestamps]
+        results = self.model.model.generate(
+            encoder_output,
+            [prompt] * len(decoded),
+            beam_size=1,
+            max_length=self.model.max_length,
+            suppress_blank=True
+        )
+        for i, result in zip(decoded, results):
+            outputs[i] = self.tokenizer.decode(result.sequences_ids[0]).strip()
+        return outputs
+
+whisper_batcher = WhisperBatcher()
+
+def _whisper_upload(audio_data: bytes, codec: str):
+    """Whisper decodes webm/opus itself - only the file name and mime type need to match the bytes"""
+    mime_type = codec.split(";")[0].strip()  # "audio/webm;codecs=opus" -> "audio/webm"
+    return (f"audio.{mime_type.split('/')[-1]}", io.BytesIO(audio_data), mime_type)
+
+async def transcribe_audio_openai(audio_data: bytes, monitor: PerformanceMonitor, codec: str = "audio/webm") -> str:
+    """Optimized transcription - the browser recording is uploaded as-is, no local re-encode"""
+    try:
+        logger.info("Starting transcription...")
+        monitor.start()
+        
+        # Silent recordings are dropped by the browser's voice detection
+        if not audio_data:
+            logger.warning("Empty audio")
+            return ""
+        
+        if USE_LOCAL_WHISPER:
+            # Batched together with other sessions' requests
+            transcript = await whisper_batcher.transcribe(audio_data)
+        else:
             # Check if API key is configured
             if not openai_api_key:
                 logger.error("OpenAI API key not configured")
                 return "[ERROR: API key not configured]"
                 
             # Transcribe with Whisper
-            client = openai.OpenAI(api_key=openai_api_key)
-            with open(tmp_path, "rb") as audio_file:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="text",
-                    language="en"
-                )
-            
-            performance_monitor.record("transcription_time")
-            logger.info(f"Transcription completed: {transcript.strip()}")
-            
-            return transcript.strip()
-            
-        finally:
-            # Clean up temp file
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+            transcript = await openai_client.audio.transcriptions.create(
+                model="whisper-1",
+                file=_whisper_upload(audio_data, codec),
+                response_format="text",
+                language="en"
+            )
+        
+        monitor.record("transcription_time")
+        logger.info(f"Transcription completed: {transcript.strip()}")
+        
+        return transcript.strip()
     
     except Exception as e:
         logger.error(f"Transcription error: {e}")
         return f"[Transcription Error: {str(e)}]"
 
-async def get_openai_response(user_input: str) -> str:
-    """Optimized OpenAI response with faster model"""
+async def get_embedding(text: str):
+    """Normalized float32 embedding used for semantic cache lookups (None on failure)"""
+    if not openai_api_key:
+        return None
+    
+    try:
+        result = await openai_client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+        embedding = np.asarray(result.data[0].embedding, dtype=np.float32)
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+    
+    except Exception as e:
+        logger.error(f"Embedding error: {e}")
+        return None
+
+async def get_openai_response(user_input: str, monitor: PerformanceMonitor, sentences: Optional[asyncio.Queue] = None) -> str:
+    """Streamed OpenAI response - complete sentences are queued for TTS while the rest is generated"""
+    reply = None
     try:
         logger.info("Getting AI response...")
         
-        if not user_input.strip() or user_input.startswith("[ERROR"):
-            return "I didn't catch that. Could you please repeat?"
-        
         # Check if API key is configured
         if not openai_api_key:
-            return "[ERROR: OpenAI API key not configured. Please set the OPENAI_API_KEY environment variable.]"
+            reply = "[ERROR: OpenAI API key not configured. Please set the OPENAI_API_KEY environment variable.]"
+            return reply
         
-        # Shorter, more focused system prompt
-        system_prompt = """You are BigShip's helpful voice assistant. Give short, clear answers (1-2 sentences max) about shipping and logistics. Key info: BigShip offers 40% savings, covers 25,000+ pin codes, partners with major couriers, provides real-time tracking."""
-        
-        # Get response from OpenAI
-        client = openai.OpenAI(api_key=openai_api_key)
-        response = client.chat.completions.create(
+        # Stream the response from OpenAI
+        stream = await openai_client.chat.completions.create(
             model=OPENAI_MODEL,
             messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input}
+                {"role": "system", "content": SYSTEM_PROMPT},  # Cacheable static prefix
+                {"role": "user", "content": user_input}  # Dynamic content last
             ],
-            max_tokens=60,  # Shorter responses
+            max_tokens=80,  # Shorter responses (o200k tokenizer)
             temperature=0.3,
+            response_format={"type": "text"},
+            stream=True,
             timeout=10  # 10 second timeout
         )
         
-        performance_monitor.record("response_time")
+        parts = []
+        pending = ""
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            parts.append(delta)
+            
+            # Hand every finished sentence to TTS right away
+            pending += delta
+            *finished, pending = SENTENCE_BOUNDARY.split(pending)
+            for sentence in finished:
+                if sentences is not None and sentence.strip():
+                    await sentences.put(sentence.strip())
         
-        result = response.choices[0].message.content.strip()
+        if sentences is not None and pending.strip():
+            await sentences.put(pending.strip())
+        
+        monitor.record("response_time")
+        
+        result = "".join(parts).strip()
         logger.info(f"AI response: {result}")
         return result
     
     except Exception as e:
         logger.error(f"OpenAI response error: {e}")
-        return f"I'm having trouble connecting right now. Error: {str(e)}"
+        reply = f"I'm having trouble connecting right now. Error: {str(e)}"
+        return reply
+    
+    finally:
+        if sentences is not None:
+            if reply is not None:
+                await sentences.put(reply)
+            await sentences.put(None)  # No more sentences
+
+async def send_message(websocket: WebSocket, payload: dict):
+    """Control message as a JSON text frame, encoded with orjson"""
+    await websocket.send_text(orjson.dumps(payload).decode('utf-8'))
 
-async def text_to_speech(text: str) -> str:
-    """Optimized TTS with faster voice and shorter text"""
+async def send_audio_chunk(websocket: WebSocket, audio: bytes):
+    """Forward a piece of MP3 audio to the browser as a binary frame - no base64 inflation"""
+    await websocket.send_bytes(audio)
+
+async def text_to_speech(text: str, websocket: Optional[WebSocket] = None) -> bytes:
+    """Optimized TTS with faster voice and shorter text, streamed to the websocket as it is synthesized"""
     try:
         logger.info("Generating speech...")
         
@@ -183,143 +648,270 @@ async def text_to_speech(text: str) -> str:
         if len(text) > 150:
             text = text[:147] + "..."
         
+        # Canned replies are synthesized once
+        cache_key = _tts_cache_key(text)
+        cached_audio = await _tts_cache_get(cache_key)
+        if cached_audio is not None:
+            logger.info("TTS cache hit")
+            if websocket is not None:
+                await send_audio_chunk(websocket, cached_audio)
+            return cached_audio
+        
         # Use faster voice settings
         communicate = edge_tts.Communicate(
             text, 
-            "en-US-JennyNeural",  # Faster US voice
-            rate="+10%",  # Slightly faster speech
-            pitch="+0Hz"
+            TTS_VOICE,
+            rate=TTS_RATE,
+            pitch=TTS_PITCH
         )
         
-        audio_bytes = b""
+        audio_chunks = []
         async for chunk in communicate.stream():
             if chunk["type"] == "audio":
-                audio_bytes += chunk["data"]
+                audio_chunks.append(chunk["data"])
+                if websocket is not None:
+                    await send_audio_chunk(websocket, chunk["data"])
+        audio_bytes = b"".join(audio_chunks)
         
-        performance_monitor.record("tts_time")
         logger.info("TTS completed successfully")
         
-        return base64.b64encode(audio_bytes).decode('utf-8')
+        if audio_bytes:
+            _tts_cache_put(cache_key, audio_bytes)
+        return audio_bytes
     
     except Exception as e:
         logger.error(f"TTS error: {e}")
-        return ""
+        return b""
+
+async def speak_sentences(sentences: asyncio.Queue, monitor: PerformanceMonitor, websocket: Optional[WebSocket] = None) -> Tuple[bytes, bool]:
+    """TTS worker - synthesizes queued sentences while the LLM is still generating.
+    Returns the audio and whether every sentence was spoken."""
+    audio_parts = []
+    complete = True
+    while True:
+        sentence = await sentences.get()
+        if sentence is None:
+            break
+        audio = await text_to_speech(sentence, websocket)
+        if not audio:
+            complete = False  # TTS or the socket send failed - keep going, but the reply has a gap
+        audio_parts.append(audio)
+    
+    monitor.record("tts_time")
+    # Edge TTS emits headerless MP3 frames, so per-sentence audio concatenates cleanly
+    return b"".join(audio_parts), complete
 
-async def process_audio(audio_data: bytes):
-    """Optimized processing pipeline"""
-    total_start_time = time.time()
+async def process_audio(audio_data: bytes, session: Optional[Session] = None, codec: str = "audio/webm"):
+    """Optimized processing pipeline - speech is streamed to the session's websocket when one is given"""
+    total_start_time = time.perf_counter()
+    websocket = session.ws if session else None
+    monitor = session.monitor if session else PerformanceMonitor()
     
     try:
         # Step 1: Transcribe
         transcription = await asyncio.wait_for(
-            transcribe_audio_openai(audio_data), 
+            transcribe_audio_openai(audio_data, monitor, codec), 
             timeout=15
         )
         
         if not transcription or transcription.startswith("[ERROR"):
+            if websocket is not None and not transcription:
+                # Nothing was heard - say so out loud (pre-synthesized at startup, so no TTS wait)
+                await send_message(websocket, {"type": "tts_begin"})
+                await text_to_speech(NO_INPUT_REPLY, websocket)
+                await send_message(websocket, {"type": "tts_end"})
             return {
                 "error": "Could not understand audio. Please speak clearly and try again.",
-                "processing_time": time.time() - total_start_time
+                "processing_time": time.perf_counter() - total_start_time
             }
         
         logger.info(f"Transcription: {transcription}")
         
-        # Step 2: Get AI response
-        response = await asyncio.wait_for(
-            get_openai_response(transcription), 
-            timeout=15
-        )
+        # Identical questions in flight wait for the first answer instead of re-asking the LLM
+        async with llm_cache.lock(transcription):
+            # Step 2: Check the response cache
+            cached, embedding_task = await llm_cache.lookup(transcription)
+            monitor.metrics.cache_hit = cached is not None
+            
+            if websocket is not None:
+                # Binary frames from here to tts_end are this reply's MP3
+                await send_message(websocket, {"type": "tts_begin"})
+            
+            if cached is not None:
+                logger.info("Response cache hit, skipping LLM and TTS")
+                response = cached["response"]
+                audio = cached["audio"]
+                monitor.record("response_time")
+                if websocket is not None:
+                    await send_audio_chunk(websocket, audio)
+            else:
+                # Step 3 + 4: Get AI response and generate speech sentence by sentence, overlapped
+                sentences = asyncio.Queue()
+                response, (audio, complete) = await asyncio.wait_for(
+                    asyncio.gather(
+                        get_openai_response(transcription, monitor, sentences),
+                        speak_sentences(sentences, monitor, websocket)
+                    ),
+                    timeout=25
+                )
+                
+                # Don't cache failures, including replies with sentences missing from the audio
+                if audio and complete and not response.startswith(("[ERROR", "I'm having trouble")):
+                    llm_cache.store(transcription, await embedding_task, response, audio)
+                else:
+                    embedding_task.cancel()
         
-        # Step 3: Generate speech (run in parallel with response if needed)
-        audio_base64 = await asyncio.wait_for(
-            text_to_speech(response), 
-            timeout=10
-        )
+        if websocket is not None:
+            await send_message(websocket, {"type": "tts_end"})
         
-        processing_time = time.time() - total_start_time
-        metrics = performance_monitor.get_metrics()
+        processing_time = time.perf_counter() - total_start_time
+        metrics = monitor.get_metrics()
         logger.info(f"Total processing time: {processing_time:.2f}s")
         
-        return {
+        result = {
             "transcription": transcription,
             "response": response,
-            "audio_base64": audio_base64,
             "processing_time": processing_time,
             "metrics": metrics
         }
+        if websocket is None:
+            # No socket to stream to (e.g. /api/test-audio) - report how much audio was produced
+            result["audio_bytes"] = len(audio)
+        return result
         
     except asyncio.TimeoutError:
         logger.error("Processing timeout")
         return {
             "error": "Processing took too long. Please try again.",
-            "processing_time": time.time() - total_start_time
+            "processing_time": time.perf_counter() - total_start_time
         }
     except Exception as e:
         logger.error(f"Processing error: {e}")
         return {
             "error": f"An error occurred: {str(e)}",
-            "processing_time": time.time() - total_start_time
+            "processing_time": time.perf_counter() - total_start_time
         }
 
+async def handle_audio(session: Session, audio_chunks: List[bytes], codec: str):
+    """Run one recorded utterance through the pipeline and report the result to the browser"""
+    websocket = session.ws
+    session.is_processing = True
+    await send_message(websocket, {
+        "type": "state_update", 
+        "is_processing": True
+    })
+    
+    try:
+        if codec == "audio/opus":
+            # Raw WebCodecs packets, one per frame - Whisper needs them in a container
+            audio_bytes, codec = opus_packets_to_ogg(audio_chunks), "audio/ogg"
+        else:
+            audio_bytes = b"".join(audio_chunks)
+        
+        # Process audio
+        result = await process_audio(audio_bytes, session, codec)
+        
+        if "error" in result:
+            await send_message(websocket, {
+                "type": "error",
+                "message": result["error"],
+                "processing_time": result["processing_time"]
+            })
+        else:
+            # Audio was already streamed as binary frames
+            await send_message(websocket, {
+                "type": "response",
+                "transcription": result["transcription"],
+                "response": result["response"],
+                "processing_time": result["processing_time"],
+                "metrics": result.get("metrics", {})
+            })
+            
+    except Exception as e:
+        logger.error(f"Audio processing error: {e}")
+        await send_message(websocket, {
+            "type": "error",
+            "message": f"Failed to process audio: {str(e)}"
+        })
+    
+    finally:
+        session.is_processing = False
+        await send_message(websocket, {
+            "type": "state_update", 
+            "is_processing": False
+        })
+
 # WebSocket endpoint with better error handling
+# Binary frames carry raw audio, text frames carry JSON control messages
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    conversation_state["current_websocket"] = websocket
+    session = Session(websocket)
     logger.info("WebSocket connected")
     
     try:
         while True:
-            data = await websocket.receive_json()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
             
-            if data["type"] == "audio_data":
-                conversation_state["is_processing"] = True
-                await websocket.send_json({
-                    "type": "state_update", 
-                    "is_processing": True
-                })
-                
-                try:
-                    # Process audio
-                    audio_bytes = base64.b64decode(data["audio"])
-                    result = await process_audio(audio_bytes)
-                    
-                    if "error" in result:
-                        await websocket.send_json({
-                            "type": "error",
-                            "message": result["error"],
-                            "processing_time": result["processing_time"]
-                        })
-                    else:
-                        await websocket.send_json({
-                            "type": "response",
-                            "transcription": result["transcription"],
-                            "response": result["response"],
-                            "audio_base64": result["audio_base64"],
-                            "processing_time": result["processing_time"],
-                            "metrics": result.get("metrics", {})
-                        })
-                        
-                except Exception as e:
-                    logger.error(f"Audio processing error: {e}")
-                    await websocket.send_json({
+            if message.get("bytes") is not None:
+                # A chunk of the recording, in the codec announced by audio_begin
+                if session.audio_dropped:
+                    continue
+                session.audio_size += len(message["bytes"])
+                if session.audio_size > MAX_RECORDING_BYTES:
+                    # Don't buffer without bound for a client that never sends audio_end
+                    logger.warning("Recording too large, dropped")
+                    session.reset_recording(session.codec)
+                    session.audio_dropped = True
+                    await send_message(websocket, {
                         "type": "error",
-                        "message": f"Failed to process audio: {str(e)}"
-                    })
-                
-                finally:
-                    conversation_state["is_processing"] = False
-                    await websocket.send_json({
-                        "type": "state_update", 
-                        "is_processing": False
+                        "message": "Recording is too long. Please ask a shorter question."
                     })
+                    continue
+                session.audio_chunks.append(message["bytes"])
+            elif message.get("text") is not None:
+                data = orjson.loads(message["text"])
+                if data.get("type") == "audio_begin":
+                    session.reset_recording(data.get("codec") or "audio/webm")
+                elif data.get("type") == "audio_end":
+                    if session.audio_dropped:
+                        session.reset_recording(session.codec)
+                        continue
+                    audio_chunks, codec = session.audio_chunks, session.codec
+                    session.reset_recording(codec)
+                    await handle_audio(session, audio_chunks, codec)
+                else:
+                    logger.warning(f"Unknown control message: {data.get('type')}")
                 
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
-        conversation_state["current_websocket"] = None
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
 
+@app.on_event("startup")
+async def warm_up_tts():
+    """Pre-fill the TTS cache with WARMUP_PHRASES so canned replies never wait on Edge TTS"""
+    async def synthesize_phrases():
+        for phrase in WARMUP_PHRASES:
+            await text_to_speech(phrase)
+        logger.info("TTS warm-up completed")
+    
+    # Don't hold up startup on the network
+    _run_in_background(synthesize_phrases())
+
+@app.on_event("startup")
+async def load_local_whisper():
+    """With USE_LOCAL_WHISPER=1, fail at startup instead of on every transcription if the model can't load"""
+    if USE_LOCAL_WHISPER:
+        await asyncio.to_thread(whisper_batcher.load)
+
+@app.on_event("shutdown")
+async def close_clients():
+    if openai_client is not None:
+        await openai_client.close()
+
 # API endpoint to check configuration
 @app.get("/api/status")
 async def get_status():
@@ -329,22 +921,34 @@ async def get_status():
         "openai_configured": api_configured,
         "model": OPENAI_MODEL,
         "use_whisper": USE_WHISPER,
-        "performance_metrics": conversation_state["performance_stats"]
+        "local_whisper": USE_LOCAL_WHISPER,
+        "response_cache": llm_cache.get_stats(),
+        "silero_vad": vad_available()
     }
 
 # API endpoint to test audio processing
 @app.post("/api/test-audio")
 async def test_audio_processing():
     """Test endpoint to verify audio processing works"""
-    # Create a short silent audio segment for testing
-    audio = AudioSegment.silent(duration=1000)  # 1 second of silence
-    buffer = io.BytesIO()
-    audio.export(buffer, format="wav")
-    audio_data = buffer.getvalue()
-    
-    result = await process_audio(audio_data)
+    result = await process_audio(_SILENT_1S_WAV, codec="audio/wav")
     return result
 
+# Silero VAD model for onnxruntime-web in the browser
+@app.get("/silero_vad.onnx")
+async def get_vad_model():
+    if not os.path.isfile(SILERO_VAD_PATH):
+        raise HTTPException(status_code=404, detail="Silero VAD model not found")
+    return FileResponse(SILERO_VAD_PATH, media_type="application/octet-stream")
+
+# Self-hosted onnxruntime-web runtime (script, wasm and worker files)
+@app.get("/ort/{filename}")
+async def get_ort_file(filename: str):
+    path = os.path.join(ORT_WEB_DIR, filename)
+    media_type = ORT_WEB_TYPES.get(os.path.splitext(filename)[1])
+    if os.path.basename(filename) != filename or media_type is None or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="onnxruntime-web file not found")
+    return FileResponse(path, media_type=media_type)
+
 # Frontend HTML with improved debugging
 @app.get("/", response_class=HTMLResponse)
 async def get_homepage():
@@ -651,11 +1255,131 @@ async def get_homepage():
     </div>
 
     <script>
+        // Cuts the 16kHz microphone signal into the 512-sample frames Silero VAD expects
+        const VAD_WORKLET = `
+            class VadFrames extends AudioWorkletProcessor {
+                constructor() {
+                    super();
+                    this.frame = new Float32Array(512);
+                    this.filled = 0;
+                }
+                
+                process(inputs) {
+                    const input = inputs[0][0];
+                    if (!input) return true;
+                    for (let i = 0; i < input.length; i++) {
+                        this.frame[this.filled++] = input[i];
+                        if (this.filled === this.frame.length) {
+                            let sum = 0;
+                            for (const sample of this.frame) sum += sample * sample;
+                            const level = Math.sqrt(sum / this.frame.length);
+                            this.port.postMessage({ frame: this.frame, level }, [this.frame.buffer]);
+                            this.frame = new Float32Array(512);
+                            this.filled = 0;
+                        }
+                    }
+                    return true;
+                }
+            }
+            registerProcessor('vad-frames', VadFrames);
+        `;
+        
+        // Hands 16kHz microphone PCM to the main thread in 50 ms blocks for the Opus encoder
+        const PCM_WORKLET = `
+            class PcmCapture extends AudioWorkletProcessor {
+                constructor() {
+                    super();
+                    this.block = new Float32Array(800);
+                    this.filled = 0;
+                }
+                
+                process(inputs) {
+                    const input = inputs[0][0];
+                    if (!input) return true;
+                    for (let i = 0; i < input.length; i++) {
+                        this.block[this.filled++] = input[i];
+                        if (this.filled === this.block.length) {
+                            this.port.postMessage(this.block, [this.block.buffer]);
+                            this.block = new Float32Array(800);
+                            this.filled = 0;
+                        }
+                    }
+                    return true;
+                }
+            }
+            registerProcessor('pcm-capture', PcmCapture);
+        `;
+        
+        // Records raw Opus packets with WebCodecs - no WebM muxing in the browser, the server wraps them in Ogg
+        class OpusRecorder {
+            static config = { codec: 'opus', sampleRate: 16000, numberOfChannels: 1, bitrate: 32000 };
+            
+            static isAvailable() {
+                return typeof AudioEncoder !== 'undefined' && typeof AudioWorkletNode !== 'undefined';
+            }
+            
+            constructor(stream, onChunk) {
+                this.stream = stream;
+                this.mimeType = 'audio/opus';
+                this.onChunk = onChunk; // (packet, start time in performance.now() ms)
+                this.onstop = null;
+                this.context = null;
+                this.samplesEncoded = 0;
+                this.startedAt = 0;
+            }
+            
+            async start() {
+                this.context = new AudioContext({ sampleRate: 16000 });
+                const workletUrl = URL.createObjectURL(new Blob([PCM_WORKLET], { type: 'application/javascript' }));
+                await this.context.audioWorklet.addModule(workletUrl);
+                URL.revokeObjectURL(workletUrl);
+                
+                this.encoder = new AudioEncoder({
+                    output: (chunk) => {
+                        const packet = new ArrayBuffer(chunk.byteLength);
+                        chunk.copyTo(packet);
+                        this.onChunk(packet, this.startedAt + chunk.timestamp / 1000);
+                    },
+                    error: (error) => console.error('Opus encoder error:', error)
+                });
+                this.encoder.configure(OpusRecorder.config);
+                
+                this.node = new AudioWorkletNode(this.context, 'pcm-capture', { numberOfOutputs: 0 });
+                this.node.port.onmessage = (event) => this.encode(event.data);
+                this.context.createMediaStreamSource(this.stream).connect(this.node);
+            }
+            
+            encode(samples) {
+                if (this.samplesEncoded === 0) {
+                    this.startedAt = performance.now() - samples.length / 16; // ms at 16kHz
+                }
+                const frame = new AudioData({
+                    format: 'f32',
+                    sampleRate: 16000,
+                    numberOfChannels: 1,
+                    numberOfFrames: samples.length,
+                    timestamp: Math.round(this.samplesEncoded * 1e6 / 16000), // microseconds
+                    data: samples
+                });
+                this.samplesEncoded += samples.length;
+                this.encoder.encode(frame);
+                frame.close();
+            }
+            
+            async stop() {
+                this.node.port.onmessage = null;
+                this.node.disconnect();
+                await this.encoder.flush();
+                this.encoder.close();
+                await this.context.close();
+                if (this.onstop) this.onstop();
+            }
+        }
+        
         class VoiceAssistant {
             constructor() {
                 this.ws = null;
                 this.mediaRecorder = null;
-                this.audioChunks = [];
                 this.isRecording = false;
                 this.isProcessing = false;
                 this.autoMode = false;
@@ -665,7 +1389,31 @@ async def get_homepage():
                 this.volumeThreshold = 25; // Lowered for better sensitivity
                 this.silenceTimeout = null;
                 this.silenceDelay = 2000; // 2 seconds of silence before stopping
+                this.vad = null; // Silero VAD worklet node, null when using the volume threshold
+                this.vadAvailable = false; // Server has the model and runtime (from /api/status)
+                this.vadSession = null;
+                this.vadState = null;
+                this.vadQueue = Promise.resolve(); // Frames run in order - the model is stateful
+                this.vadOnset = 0.5; // Speech probability that counts as voice
+                this.vadOffset = 0.35; // ...and as silence
+                this.vadOnsetFrames = 3; // Consecutive voiced frames (32 ms each) before recording starts
+                this.speechFrames = 0;
+                this.silentFrames = 0;
                 this.debugMode = true;
+                this.audioStream = null; // Response audio currently being streamed
+                this.chunkTimeslice = 100; // ms of audio per MediaRecorder chunk, streamed as it arrives
+                this.opusSupported = null; // WebCodecs Opus encoder available, checked on first recording
+                this.pendingChunks = []; // {data, start} recorded but not yet sent
+                this.chunksSent = 0;
+                this.chunksRecorded = 0;
+                this.firstVoiceAt = null; // performance.now() of the first/last voiced frame while recording
+                this.lastVoiceAt = null;
+                this.speechPadding = 300; // ms kept before the first and after the last voiced frame
+                this.recordingContext = null; // Level meter for manual recordings
+                this.pendingDebug = []; // DOM writes queued for the next animation frame
+                this.pendingStatus = null;
+                this.pendingVolume = null;
+                this.renderScheduled = false;
                 
                 this.micButton = document.getElementById('micButton');
                 this.status = document.getElementById('status');
@@ -678,7 +1426,15 @@ async def get_homepage():
                 this.debugPanel = document.getElementById('debugPanel');
                 this.configStatus = document.getElementById('configStatus');
                 
-                this.checkConfiguration();
+                // Empty element after the last message; while it is visible the user is at the bottom
+                this.conversationEnd = document.createElement('div');
+                this.conversation.appendChild(this.conversationEnd);
+                this.atBottom = true;
+                new IntersectionObserver(([entry]) => {
+                    this.atBottom = entry.isIntersecting;
+                }, { root: this.conversation }).observe(this.conversationEnd);
+                
+                this.configChecked = this.checkConfiguration();
                 this.initializeWebSocket();
                 this.setupEventListeners();
             }
@@ -687,6 +1443,7 @@ async def get_homepage():
                 try {
                     const response = await fetch('/api/status');
                     const data = await response.json();
+                    this.vadAvailable = Boolean(data.silero_vad);
                     
                     if (data.openai_configured) {
                         this.configStatus.textContent = '✅ OpenAI API is configured correctly';
@@ -710,8 +1467,38 @@ async def get_homepage():
                 const entry = document.createElement('div');
                 entry.className = `debug-entry debug-${type}`;
                 entry.textContent = new Date().toLocaleTimeString() + ' - ' + message;
-                this.debugPanel.appendChild(entry);
-                this.debugPanel.scrollTop = this.debugPanel.scrollHeight;
+                this.pendingDebug.push(entry);
+                this.scheduleRender();
+            }
+            
+            scheduleRender() {
+                // Debug, status and volume writes land together once per frame - one layout instead of one per call
+                if (this.renderScheduled) return;
+                this.renderScheduled = true;
+                requestAnimationFrame(() => {
+                    this.renderScheduled = false;
+                    
+                    if (this.pendingDebug.length) {
+                        const entries = document.createDocumentFragment();
+                        entries.append(...this.pendingDebug);
+                        this.pendingDebug = [];
+                        this.debugPanel.appendChild(entries);
+                        this.debugPanel.scrollTop = this.debugPanel.scrollHeight;
+                    }
+                    if (this.pendingStatus !== null) {
+                        this.status.innerHTML = this.pendingStatus;
+                        this.pendingStatus = null;
+                    }
+                    if (this.pendingVolume !== null) {
+                        this.volumeBar.style.width = this.pendingVolume;
+                        this.pendingVolume = null;
+                    }
+                });
+            }
+            
+            setVolume(width) {
+                this.pendingVolume = width;
+                this.scheduleRender();
             }
             
             initializeWebSocket() {
@@ -719,6 +1506,7 @@ async def get_homepage():
                 const wsUrl = `${protocol}//${window.location.host}/ws`;
                 
                 this.ws = new WebSocket(wsUrl);
+                this.ws.binaryType = 'arraybuffer'; // Response audio arrives as raw MP3 frames
                 
                 this.ws.onopen = () => {
                     this.addDebugEntry('WebSocket connected to server', 'info');
@@ -726,6 +1514,10 @@ async def get_homepage():
                 };
                 
                 this.ws.onmessage = (event) => {
+                    if (event.data instanceof ArrayBuffer) {
+                        this.handleAudioChunk(event.data);
+                        return;
+                    }
                     const data = JSON.parse(event.data);
                     this.handleWebSocketMessage(data);
                 };
@@ -760,7 +1552,7 @@ async def get_homepage():
                 });
                 
                 this.clearButton.addEventListener('click', () => {
-                    this.conversation.innerHTML = '';
+                    this.conversation.replaceChildren(this.conversationEnd);
                     this.debugPanel.innerHTML = '';
                     this.addDebugEntry('Cleared conversation and debug logs', 'info');
                 });
@@ -805,18 +1597,33 @@ async def get_homepage():
                         } 
                     });
                     
-                    this.audioContext = new (window.AudioContext || window.webkitAudioContext)();
-                    this.analyser = this.audioContext.createAnalyser();
-                    this.microphone = this.audioContext.createMediaStreamSource(stream);
-                    
-                    this.analyser.fftSize = 256;
-                    this.microphone.connect(this.analyser);
+                    // Silero needs 16kHz - the volume threshold runs at whatever rate the browser picks
+                    await this.configChecked;
+                    const AudioContextClass = window.AudioContext || window.webkitAudioContext;
+                    this.audioContext = new AudioContextClass(this.vadAvailable ? { sampleRate: 16000 } : undefined);
+                    try {
+                        this.microphone = this.audioContext.createMediaStreamSource(stream);
+                    } catch (error) {
+                        // Firefox won't connect a 48kHz microphone to a 16kHz context - fall back to the default rate
+                        this.audioContext.close();
+                        this.audioContext = new AudioContextClass();
+                        this.microphone = this.audioContext.createMediaStreamSource(stream);
+                    }
+                    this.vad = await this.startVad(this.microphone);
                     
                     this.updateUI('listening');
                     this.updateStatus('🎧 Auto listening... Speak naturally');
-                    this.addDebugEntry('Auto listening started', 'info');
                     
-                    this.monitorAudio();
+                    if (this.vad) {
+                        this.addDebugEntry('Auto listening started (Silero VAD)', 'info');
+                    } else {
+                        // Volume threshold on the main thread
+                        this.analyser = this.audioContext.createAnalyser();
+                        this.analyser.fftSize = 256;
+                        this.microphone.connect(this.analyser);
+                        this.addDebugEntry('Auto listening started (volume threshold)', 'info');
+                        this.monitorAudio();
+                    }
                     
                 } catch (error) {
                     console.error('Error starting auto listening:', error);
@@ -843,7 +1650,11 @@ async def get_homepage():
                     const average = dataArray.reduce((a, b) => a + b) / bufferLength;
                     
                     // Update volume indicator
-                    this.volumeBar.style.width = `${Math.min(average * 2, 100)}%`;
+                    this.setVolume(`${Math.min(average * 2, 100)}%`);
+                    
+                    if (this.isRecording) {
+                        this.trackVoice(average);
+                    }
                     
                     // Voice activity detection
                     if (average > this.volumeThreshold && !this.isRecording && !this.isProcessing) {
@@ -874,7 +1685,131 @@ async def get_homepage():
                 checkAudio();
             }
             
+            async startVad(source) {
+                // Silero VAD fed from an AudioWorklet; null if the model or runtime isn't available
+                await this.configChecked;
+                if (!this.vadAvailable || !this.audioContext.audioWorklet || this.audioContext.sampleRate !== 16000) {
+                    return null;
+                }
+                try {
+                    if (!window.ort) {
+                        // Loaded only when needed, and only from this server
+                        await this.loadScript('/ort/ort.min.js');
+                        ort.env.wasm.wasmPaths = '/ort/';
+                    }
+                    if (!this.vadSession) {
+                        ort.env.wasm.proxy = true; // Inference runs in onnxruntime's worker, off the main thread
+                        this.vadSession = await ort.InferenceSession.create('/silero_vad.onnx');
+                    }
+                    const workletUrl = URL.createObjectURL(new Blob([VAD_WORKLET], { type: 'application/javascript' }));
+                    await this.audioContext.audioWorklet.addModule(workletUrl);
+                    URL.revokeObjectURL(workletUrl);
+                    
+                    // No outputs, so the node is pulled without being connected to the speakers
+                    const node = new AudioWorkletNode(this.audioContext, 'vad-frames', { numberOfOutputs: 0 });
+                    this.vadState = new ort.Tensor('float32', new Float32Array(2 * 128), [2, 1, 128]);
+                    this.speechFrames = 0;
+                    this.silentFrames = 0;
+                    node.port.onmessage = (event) => {
+                        // A failed frame is logged and skipped - it must not break the chain for later frames
+                        this.vadQueue = this.vadQueue
+                            .then(() => this.runVad(event.data))
+                            .catch(error => this.addDebugEntry('VAD frame failed: ' + error, 'error'));
+                    };
+                    source.connect(node);
+                    return node;
+                } catch (error) {
+                    this.addDebugEntry('Silero VAD unavailable, using volume threshold: ' + error, 'warning');
+                    return null;
+                }
+            }
+            
+            loadScript(src) {
+                return new Promise((resolve, reject) => {
+                    const script = document.createElement('script');
+                    script.src = src;
+                    script.onload = resolve;
+                    script.onerror = () => reject(new Error('Could not load ' + src));
+                    document.head.appendChild(script);
+                });
+            }
+            
+            async runVad({ frame, level }) {
+                if (!this.vad) return;
+                const result = await this.vadSession.run({
+                    input: new ort.Tensor('float32', frame, [1, frame.length]),
+                    state: this.vadState,
+                    sr: new ort.Tensor('int64', BigInt64Array.from([16000n]), [1])
+                });
+                this.vadState = result.stateN;
+                this.handleSpeechProb(result.output.data[0], level);
+            }
+            
+            handleSpeechProb(prob, level) {
+                if (!this.autoMode) return;
+                
+                this.setVolume(`${Math.min(level * 400, 100)}%`);
+                
+                if (prob > this.vadOnset) {
+                    this.speechFrames++;
+                    this.silentFrames = 0;
+                } else {
+                    this.speechFrames = 0;
+                    if (prob < this.vadOffset) this.silentFrames++;
+                }
+                
+                if (this.isRecording) {
+                    if (prob > this.vadOnset) this.markVoice();
+                    if (this.silentFrames * 32 >= this.silenceDelay) {
+                        this.addDebugEntry('Silence detected, stopping recording', 'info');
+                        this.stopRecording();
+                    }
+                } else if (this.speechFrames >= this.vadOnsetFrames && !this.isProcessing) {
+                    this.addDebugEntry(`Speech detected (p=${prob.toFixed(2)}), starting recording`, 'info');
+                    this.startRecording(true); // Pass true for auto mode
+                }
+            }
+            
+            trackVoice(average) {
+                if (average > this.volumeThreshold / 2) {
+                    this.markVoice();
+                }
+            }
+            
+            markVoice() {
+                const now = performance.now();
+                if (this.firstVoiceAt === null) {
+                    this.firstVoiceAt = now;
+                }
+                this.lastVoiceAt = now;
+            }
+            
+            monitorRecording(stream) {
+                // Manual mode has no auto-listening analyser, so meter the recording stream itself
+                this.recordingContext = new (window.AudioContext || window.webkitAudioContext)();
+                const analyser = this.recordingContext.createAnalyser();
+                analyser.fftSize = 256;
+                this.recordingContext.createMediaStreamSource(stream).connect(analyser);
+                const dataArray = new Uint8Array(analyser.frequencyBinCount);
+                
+                const checkAudio = () => {
+                    if (!this.isRecording || !this.recordingContext) return;
+                    analyser.getByteFrequencyData(dataArray);
+                    const average = dataArray.reduce((a, b) => a + b) / dataArray.length;
+                    this.setVolume(`${Math.min(average * 2, 100)}%`);
+                    this.trackVoice(average);
+                    requestAnimationFrame(checkAudio);
+                };
+                
+                checkAudio();
+            }
+            
             stopAutoListening() {
+                if (this.vad) {
+                    this.vad.port.onmessage = null;
+                    this.vad.disconnect();
+                    this.vad = null;
+                }
                 if (this.audioContext) {
                     this.audioContext.close();
                     this.audioContext = null;
@@ -895,7 +1830,7 @@ async def get_homepage():
                 }
                 this.updateUI('idle');
                 this.updateStatus('Click to start or enable Auto Mode');
-                this.volumeBar.style.width = '0%';
+                this.setVolume('0%');
                 this.addDebugEntry('Auto listening stopped', 'info');
             }
             
@@ -919,26 +1854,27 @@ async def get_homepage():
                         });
                     }
                     
-                    this.mediaRecorder = new MediaRecorder(stream, {
-                        mimeType: 'audio/webm;codecs=opus'
-                    });
-                    
-                    this.audioChunks = [];
+                    this.pendingChunks = [];
+                    this.chunksSent = 0;
+                    this.chunksRecorded = 0;
+                    this.firstVoiceAt = null;
+                    this.lastVoiceAt = null;
                     this.isRecording = true;
+                    this.mediaRecorder = null; // Until the new recorder is running
                     
-                    this.mediaRecorder.ondataavailable = (event) => {
-                        if (event.data.size > 0) {
-                            this.audioChunks.push(event.data);
-                        }
-                    };
+                    // Chunks go out while the user is still talking; trailing silence is held back and dropped
+                    this.mediaRecorder = await this.createRecorder(stream, (data, start) => {
+                        this.pendingChunks.push({ data, start });
+                        this.chunksRecorded++;
+                        this.sendSpeechChunks();
+                    });
                     
                     this.mediaRecorder.onstop = () => {
                         this.processRecording();
                     };
                     
-                    this.mediaRecorder.start();
-                    
                     if (!autoMode) {
+                        this.monitorRecording(stream);
                         this.updateUI('recording');
                         this.updateStatus('🎤 Recording... Click to stop or wait for silence');
                         this.addDebugEntry('Manual recording started', 'info');
@@ -949,11 +1885,43 @@ async def get_homepage():
                     
                 } catch (error) {
                     console.error('Error starting recording:', error);
+                    this.isRecording = false;
                     this.addDebugEntry('Microphone access denied: ' + error, 'error');
                     this.updateStatus('❌ Microphone access denied');
                 }
             }
             
+            async createRecorder(stream, onChunk) {
+                // Raw Opus from WebCodecs where the browser has it, MediaRecorder's WebM/Opus otherwise
+                if (this.opusSupported === null) {
+                    this.opusSupported = OpusRecorder.isAvailable() &&
+                        (await AudioEncoder.isConfigSupported(OpusRecorder.config).catch(() => ({}))).supported === true;
+                }
+                if (this.opusSupported) {
+                    const recorder = new OpusRecorder(stream, onChunk);
+                    try {
+                        await recorder.start();
+                        return recorder;
+                    } catch (error) {
+                        this.addDebugEntry('WebCodecs Opus unavailable, using MediaRecorder: ' + error, 'warning');
+                        this.opusSupported = false;
+                        if (recorder.context) recorder.context.close();
+                    }
+                }
+                
+                const recorder = new MediaRecorder(stream, {
+                    mimeType: 'audio/webm;codecs=opus',
+                    audioBitsPerSecond: 32000 // Plenty for speech; the server estimates clip length from it
+                });
+                recorder.ondataavailable = (event) => {
+                    if (event.data.size > 0) {
+                        onChunk(event.data, performance.now() - this.chunkTimeslice);
+                    }
+                };
+                recorder.start(this.chunkTimeslice);
+                return recorder;
+            }
+            
             stopRecording() {
                 if (this.mediaRecorder && this.isRecording) {
                     this.mediaRecorder.stop();
@@ -962,23 +1930,53 @@ async def get_homepage():
                         this.mediaRecorder.stream.getTracks().forEach(track => track.stop());
                     }
                     this.isRecording = false;
+                    if (this.recordingContext) {
+                        this.recordingContext.close();
+                        this.recordingContext = null;
+                        this.setVolume('0%');
+                    }
                     this.updateUI('processing');
                     this.updateStatus('⏳ Processing...');
                     this.addDebugEntry('Recording stopped, processing audio', 'info');
                 }
             }
             
-            async processRecording() {
-                const audioBlob = new Blob(this.audioChunks, { type: 'audio/webm' });
-                const arrayBuffer = await audioBlob.arrayBuffer();
-                const base64Audio = btoa(String.fromCharCode(...new Uint8Array(arrayBuffer)));
+            sendSpeechChunks() {
+                // Send chunks up to the last voiced frame; the first chunk carries the WebM header, if any
+                if (this.lastVoiceAt === null || !this.ws || this.ws.readyState !== WebSocket.OPEN) return;
+                if (this.chunksSent === 0 && this.mediaRecorder.mimeType === 'audio/opus') {
+                    // Raw Opus packets stand alone, so leading silence can be dropped as well
+                    const onset = this.firstVoiceAt - this.speechPadding;
+                    while (this.pendingChunks.length && this.pendingChunks[0].start < onset) {
+                        this.pendingChunks.shift();
+                    }
+                }
+                const cutoff = this.lastVoiceAt + this.speechPadding;
+                while (this.pendingChunks.length &&
+                       (this.chunksSent === 0 || this.pendingChunks[0].start <= cutoff)) {
+                    if (this.chunksSent === 0) {
+                        this.ws.send(JSON.stringify({ type: 'audio_begin', codec: this.mediaRecorder.mimeType || 'audio/webm' }));
+                    }
+                    this.ws.send(this.pendingChunks.shift().data); // Binary frame
+                    this.chunksSent++;
+                }
+            }
+            
+            processRecording() {
+                if (this.lastVoiceAt === null) {
+                    // Nothing but silence - don't pay for a Whisper round trip
+                    this.addDebugEntry('No speech detected, recording discarded', 'warning');
+                    this.updateUI(this.autoMode ? 'listening' : 'idle');
+                    this.updateStatus(this.autoMode ? '🎧 Listening for next question...' : 'No speech detected. Click to try again');
+                    return;
+                }
                 
-                if (this.ws && this.ws.readyState === WebSocket.OPEN) {
-                    this.addDebugEntry('Sending audio to server for processing', 'info');
-                    this.ws.send(JSON.stringify({
-                        type: 'audio_data',
-                        audio: base64Audio
-                    }));
+                this.sendSpeechChunks();
+                this.pendingChunks = []; // Trailing silence
+                
+                if (this.ws && this.ws.readyState === WebSocket.OPEN && this.chunksSent > 0) {
+                    this.addDebugEntry(`Streamed ${this.chunksSent}/${this.chunksRecorded} chunks (silence trimmed)`, 'info');
+                    this.ws.send(JSON.stringify({ type: 'audio_end' }));
                 } else {
                     this.addDebugEntry('WebSocket not connected, cannot send audio', 'error');
                     this.updateStatus('❌ Connection error. Please refresh.');
@@ -988,10 +1986,18 @@ async def get_homepage():
             
             handleWebSocketMessage(data) {
                 switch (data.type) {
+                    case 'tts_begin':
+                        this.handleAudioEnd(); // Close out a reply that never got its tts_end
+                        this.audioStream = this.createAudioStream();
+                        break;
+                    case 'tts_end':
+                        this.handleAudioEnd();
+                        break;
                     case 'response':
                         this.handleResponse(data);
                         break;
                     case 'error':
+                        this.handleAudioEnd();
                         this.handleError(data.message, data.processing_time);
                         break;
                     case 'state_update':
@@ -1001,17 +2007,15 @@ async def get_homepage():
             }
             
             handleResponse(data) {
+                // Flush any streamed audio the server didn't close
+                this.handleAudioEnd();
+                
                 // Add user message
                 this.addMessage(data.transcription, 'user');
                 
                 // Add assistant response
                 this.addMessage(data.response, 'assistant', data.processing_time, data.metrics);
                 
-                // Play audio response
-                if (data.audio_base64) {
-                    this.playAudio(data.audio_base64);
-                }
-                
                 this.addDebugEntry(`Processing completed in ${data.processing_time.toFixed(2)}s`, 'info');
                 
                 if (this.autoMode) {
@@ -1051,23 +2055,78 @@ async def get_homepage():
                 if (metrics) {
                     const metricsDiv = document.createElement('div');
                     metricsDiv.className = 'metrics';
-                    metricsDiv.textContent = `Transcription: ${metrics.transcription_time?.toFixed(1) || 0}s, Response: ${metrics.response_time?.toFixed(1) || 0}s, TTS: ${metrics.tts_time?.toFixed(1) || 0}s`;
+                    metricsDiv.textContent = `Transcription: ${metrics.transcription_time?.toFixed(1) || 0}s, Response: ${metrics.response_time?.toFixed(1) || 0}s, TTS: ${metrics.tts_time?.toFixed(1) || 0}s${metrics.cache_hit ? ' (cached)' : ''}`;
                     messageDiv.appendChild(metricsDiv);
                 }
                 
-                this.conversation.appendChild(messageDiv);
-                this.conversation.scrollTop = this.conversation.scrollHeight;
+                this.conversation.insertBefore(messageDiv, this.conversationEnd);
+                if (this.atBottom) {
+                    // Follow new messages unless the user has scrolled up to read older ones
+                    requestAnimationFrame(() => this.conversationEnd.scrollIntoView({ block: 'nearest', behavior: 'instant' }));
+                }
             }
             
-            playAudio(base64Audio) {
-                try {
-                    const audio = new Audio(`data:audio/mpeg;base64,${base64Audio}`);
+            handleAudioChunk(chunk) {
+                if (!this.audioStream) {
+                    this.audioStream = this.createAudioStream();
+                }
+                this.audioStream.queue.push(chunk);
+                this.appendAudioChunks(this.audioStream);
+            }
+            
+            handleAudioEnd() {
+                const stream = this.audioStream;
+                this.audioStream = null;
+                if (!stream) return;
+                
+                stream.ended = true;
+                if (stream.mediaSource) {
+                    this.appendAudioChunks(stream);
+                } else {
+                    // No MediaSource support: play once everything has arrived
+                    this.playAudioBlob(new Blob(stream.queue, { type: 'audio/mpeg' }));
+                }
+            }
+            
+            createAudioStream() {
+                const stream = { queue: [], ended: false, mediaSource: null, sourceBuffer: null };
+                
+                if (window.MediaSource && MediaSource.isTypeSupported('audio/mpeg')) {
+                    // Start playback on the first chunk instead of waiting for the full reply
+                    stream.mediaSource = new MediaSource();
+                    const audio = new Audio(URL.createObjectURL(stream.mediaSource));
+                    audio.addEventListener('ended', () => URL.revokeObjectURL(audio.src));
+                    stream.mediaSource.addEventListener('sourceopen', () => {
+                        stream.sourceBuffer = stream.mediaSource.addSourceBuffer('audio/mpeg');
+                        stream.sourceBuffer.addEventListener('updateend', () => this.appendAudioChunks(stream));
+                        this.appendAudioChunks(stream);
+                    }, { once: true });
                     audio.play().catch(error => {
                         this.addDebugEntry('Audio playback error: ' + error, 'error');
                     });
-                } catch (error) {
-                    this.addDebugEntry('Audio creation error: ' + error, 'error');
                 }
+                
+                return stream;
+            }
+            
+            appendAudioChunks(stream) {
+                // A SourceBuffer accepts one append at a time, the rest wait for 'updateend'
+                if (!stream.sourceBuffer || stream.sourceBuffer.updating) return;
+                
+                if (stream.queue.length) {
+                    stream.sourceBuffer.appendBuffer(stream.queue.shift());
+                } else if (stream.ended && stream.mediaSource.readyState === 'open') {
+                    stream.mediaSource.endOfStream();
+                }
+            }
+            
+            playAudioBlob(blob) {
+                const url = URL.createObjectURL(blob);
+                const audio = new Audio(url);
+                audio.addEventListener('ended', () => URL.revokeObjectURL(url));
+                audio.play().catch(error => {
+                    this.addDebugEntry('Audio playback error: ' + error, 'error');
+                });
             }
             
             updateUI(state) {
@@ -1089,7 +2148,8 @@ async def get_homepage():
             }
             
             updateStatus(message) {
-                this.status.innerHTML = message;
+                this.pendingStatus = message;
+                this.scheduleRender();
             }
             
             testConnection() {
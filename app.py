@@ -1,22 +1,23 @@
-import os
+import re
 import sys
-import queue
 import json
-import tempfile
 import asyncio
 import time
 import gc
 import io
 import threading
+from functools import lru_cache
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
+import torch
 import sounddevice as sd
 import vosk
 
 import chromadb
 from sentence_transformers import SentenceTransformer
 import edge_tts
-from pydub import AudioSegment
 import pygame
 
 
@@ -28,12 +29,42 @@ COLLECTION_NAME = "qna_collection"
 
 VOSK_MODEL_PATH = r"C:\Users\mysel\OneDrive\Pictures\310\vosk-model-small-en-us-0.15"
 SAMPLE_RATE = 16000
+BLOCK_SIZE = 8000  # Samples per microphone callback (0.5 s)
+RING_BLOCKS = 50  # Microphone blocks kept before the oldest is overwritten
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_ONNX_FILE = "onnx/model_qint8_avx2.onnx"  # int8-quantized export published with the model
+EMBEDDING_BATCH_SIZE = 256
+
+PARTIAL_PRINT_INTERVAL = 0.1  # Seconds between "Listening: ..." updates
+
+MIXER_FREQUENCY = 22050
+MIXER_BUFFER = 512  # Samples - also how far playback lags behind the mixer
 
 EDGE_VOICE = "en-US-JennyNeural"  # You can change the voice if you want
 
 # Greeting message
 GREETING_MESSAGE = "Hello! I'm your Bigship voice assistant. How can I help you today?"
 
+# Phrases Vosk tends to produce from unclear speech, matched in a single regex pass
+GARBLED_INDICATORS = ["murder", "oh i see", "that is", "of and that"]
+GARBLED_RE = re.compile("|".join(map(re.escape, GARBLED_INDICATORS)))
+
+
+def load_embedder():
+    """FP16 on GPU, int8 ONNX on CPU, plain FP32 if the ONNX backend isn't installed"""
+    if torch.cuda.is_available():
+        return SentenceTransformer(EMBEDDING_MODEL, device="cuda").half()
+    try:
+        return SentenceTransformer(
+            EMBEDDING_MODEL,
+            backend="onnx",
+            model_kwargs={"file_name": EMBEDDING_ONNX_FILE}
+        )
+    except Exception as e:
+        print(f"ONNX embedder unavailable ({e}), using the PyTorch model")
+        return SentenceTransformer(EMBEDDING_MODEL)
+
 
 def upload_excel_to_chroma(client, model):
     print("Uploading Excel data to ChromaDB...")
@@ -48,15 +79,14 @@ def upload_excel_to_chroma(client, model):
     collection = client.create_collection(COLLECTION_NAME)
     print(f"Created collection '{COLLECTION_NAME}'")
 
-    excel_file = pd.ExcelFile(EXCEL_PATH)
+    # Every sheet in one pass over the workbook; only Question (col 0) and Answer (col 2) are parsed
+    sheets = pd.read_excel(EXCEL_PATH, sheet_name=None, engine='openpyxl', usecols=[0, 2])
     all_questions = []
     all_answers = []
 
-    for sheet_name in excel_file.sheet_names:
+    for sheet_name, df in sheets.items():
         print(f"Processing sheet: {sheet_name}")
-        df = pd.read_excel(excel_file, sheet_name=sheet_name, engine='openpyxl')
-        # Extract Question (col 0), ignore col 1, Answer (col 2)
-        df_slice = df.iloc[:, [0, 2]].dropna()
+        df_slice = df.dropna()
         questions = df_slice.iloc[:, 0].astype(str).tolist()
         answers = df_slice.iloc[:, 1].astype(str).tolist()
         all_questions.extend(questions)
@@ -65,14 +95,26 @@ def upload_excel_to_chroma(client, model):
     print(f"Total Q&A pairs extracted: {len(all_questions)}")
 
     print("Generating embeddings for questions...")
-    embeddings = model.encode(all_questions, show_progress_bar=True)
+    embeddings = model.encode(
+        all_questions,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=True
+    )
 
-    for idx, (q, a, emb) in enumerate(zip(all_questions, all_answers, embeddings)):
+    # Adds as large as Chroma accepts (~5.4k rows on SQLite) - one transaction per batch instead of one per row
+    if hasattr(client, "get_max_batch_size"):
+        batch_size = client.get_max_batch_size()
+    else:
+        batch_size = client.max_batch_size
+    for start in range(0, len(all_questions), batch_size):
+        end = start + batch_size
         collection.add(
-            ids=[str(idx)],
-            documents=[q],
-            metadatas=[{"answer": a}],
-            embeddings=[emb.tolist()]
+            ids=[str(idx) for idx in range(start, min(end, len(all_questions)))],
+            documents=all_questions[start:end],
+            metadatas=[{"answer": a} for a in all_answers[start:end]],
+            embeddings=embeddings[start:end].tolist()
         )
 
     print(f"Uploaded {len(all_questions)} Q&A pairs successfully.")
@@ -97,114 +139,146 @@ def get_existing_collection(client):
         return None
 
 
+@lru_cache(maxsize=None)
+def load_vosk_model(path=VOSK_MODEL_PATH):
+    """Load the Vosk model once per process - it is hundreds of MB and takes seconds"""
+    return vosk.Model(path)
+
+
+class AudioRing:
+    """Preallocated single-producer/single-consumer ring of int16 blocks; the oldest block is overwritten when full"""
+
+    def __init__(self, blocks, block_size):
+        self.buffer = np.zeros((blocks, block_size), dtype=np.int16)
+        self.lengths = np.zeros(blocks, dtype=np.int64)
+        self.head = 0  # Blocks written - only the audio callback moves it
+        self.tail = 0  # Blocks read - only the decode loop moves it
+
+    def push(self, indata, frames):
+        slot = self.head % len(self.buffer)
+        self.buffer[slot, :frames] = np.frombuffer(indata, dtype=np.int16, count=frames)
+        self.lengths[slot] = frames
+        self.head += 1
+
+    def pop(self):
+        """Oldest unread block as bytes for Vosk, or None if there is nothing new"""
+        if self.tail == self.head:
+            return None
+        self.tail = max(self.tail, self.head - len(self.buffer))  # Skip blocks that were overwritten
+        slot = self.tail % len(self.buffer)
+        data = self.buffer[slot, :self.lengths[slot]].tobytes()
+        self.tail += 1
+        return data
+
+    def clear(self):
+        self.tail = self.head
+
+
+def load_answer_index(collection):
+    """Normalized question embeddings and their answers, pulled out of Chroma once for brute-force search"""
+    records = collection.get(include=["embeddings", "metadatas"])
+    if not records["ids"]:
+        return np.zeros((0, 0), dtype=np.float32), []
+    # float32, not float16: NumPy has no BLAS path for half precision, so FP16 matmuls are slower on CPU
+    embeddings = np.asarray(records["embeddings"], dtype=np.float32)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    answers = [metadata.get("answer", "No answer found.") for metadata in records["metadatas"]]
+    return embeddings, answers
+
+
 def play_audio_from_memory(audio_data):
-    """Play audio from memory using pygame mixer"""
+    """Play MP3 audio from memory using pygame mixer (SDL_mixer decodes it, no ffmpeg)"""
     try:
-        # Initialize pygame mixer
-        pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
-        
-        # Create a temporary file in memory
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_file:
-            temp_file.write(audio_data)
-            temp_file_path = temp_file.name
-        
-        # Load and play the audio
-        pygame.mixer.music.load(temp_file_path)
-        pygame.mixer.music.play()
-        
-        # Wait for playback to finish
-        while pygame.mixer.music.get_busy():
-            pygame.time.wait(100)
-        
-        # Clean up
-        pygame.mixer.music.unload()
-        pygame.mixer.quit()
+        # Load and play the audio (the mixer is opened once in main)
+        sound = pygame.mixer.Sound(io.BytesIO(audio_data))
+        sound.play()
         
-        # Remove temporary file
-        try:
-            os.remove(temp_file_path)
-        except:
-            pass
+        # Wait exactly as long as the reply lasts instead of polling get_busy()
+        time.sleep(sound.get_length() + MIXER_BUFFER / MIXER_FREQUENCY)
             
     except Exception as e:
         print(f"Error playing audio: {e}")
 
 
 def run_voice_assistant(collection, embedder):
-    q_audio = queue.Queue()
-    vosk_model = vosk.Model(VOSK_MODEL_PATH)
+    # Bounded ring of 0.5 s blocks - the callback only copies into it and old audio simply falls off
+    q_audio = AudioRing(RING_BLOCKS, BLOCK_SIZE)
+    vosk_model = load_vosk_model()
+    # A few thousand questions at most - one matrix-vector product beats an HNSW round trip
+    question_embeddings, answer_texts = load_answer_index(collection)
+    
+    # Set while a reply is being spoken; audio captured meanwhile is thrown away by the decode loop
+    speaking = threading.Event()
     
-    # Global flag to control audio input
-    listening_active = True
-    audio_lock = threading.Lock()
+    # Replies are synthesized and played here, one at a time, while the main loop keeps decoding
+    speaker = ThreadPoolExecutor(max_workers=1)
+    
+    # One long-lived event loop for Edge TTS instead of asyncio.run per reply
+    tts_loop = asyncio.new_event_loop()
+    threading.Thread(target=tts_loop.run_forever, daemon=True).start()
+    # Edge TTS request in flight on that loop - cancelled on shutdown so the speaker never waits on a stopped loop
+    synthesis = None
 
     def audio_callback(indata, frames, time, status):
         if status:
             print(status, file=sys.stderr)
-        if listening_active:
-            q_audio.put(bytes(indata))
+        q_audio.push(indata, frames)
 
     async def speak_text(text):
-        nonlocal listening_active
-        
-        # Pause listening while speaking
-        with audio_lock:
-            listening_active = False
+        # Generate TTS audio in memory
+        communicate = edge_tts.Communicate(text, EDGE_VOICE)
         
+        # Get audio data as bytes (collected and joined once, not re-copied per chunk)
+        audio_chunks = []
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio_chunks.append(chunk["data"])
+        return b"".join(audio_chunks)
+
+    def speak_text_sync(text):
+        nonlocal synthesis
         try:
-            # Generate TTS audio in memory
-            communicate = edge_tts.Communicate(text, EDGE_VOICE)
-            
-            # Get audio data as bytes
-            audio_data = b""
-            async for chunk in communicate.stream():
-                if chunk["type"] == "audio":
-                    audio_data += chunk["data"]
-            
-            # Convert to AudioSegment in memory
-            audio_segment = AudioSegment.from_file(io.BytesIO(audio_data), format="mp3")
-            
-            # Export to WAV format in memory
-            wav_buffer = io.BytesIO()
-            audio_segment.export(wav_buffer, format="wav")
-            wav_data = wav_buffer.getvalue()
+            # Only the network work runs on the shared loop - playback blocks this speaker thread
+            synthesis = asyncio.run_coroutine_threadsafe(speak_text(text), tts_loop)
+            audio_data = synthesis.result()
             
-            # Play the audio using pygame
-            play_audio_from_memory(wav_data)
+            # Play the MP3 directly using pygame
+            play_audio_from_memory(audio_data)
             
+        except CancelledError:
+            # Shutting down - the request was dropped along with the loop
+            pass
         except Exception as e:
             print(f"Error during text-to-speech: {e}")
         finally:
-            # Resume listening after a short delay
-            time.sleep(0.5)  # Wait for audio to fully stop
-            with audio_lock:
-                listening_active = True
+            # Playback has ended, but the microphone block being filled right now still holds the
+            # reply's tail - stay deaf for one block length so the decode loop drops it too
+            time.sleep(BLOCK_SIZE / SAMPLE_RATE)
+            speaking.clear()
 
-    def speak_text_sync(text):
-        asyncio.run(speak_text(text))
+    def say(text):
+        # Pause listening while speaking - set here, before the worker picks the reply up
+        speaking.set()
+        return speaker.submit(speak_text_sync, text)
 
     def query_chroma_db(question_text, top_k=1):
         if not question_text.strip():
             return ["Sorry, I didn't catch that. Could you please repeat your question?"]
         
         # Simple check for garbled speech recognition
-        garbled_indicators = ["murder", "oh i see", "that is", "of and that"]
-        question_lower = question_text.lower()
-        for indicator in garbled_indicators:
-            if indicator in question_lower:
-                return ["I'm having trouble understanding. Could you please repeat your question more clearly?"]
+        if GARBLED_RE.search(question_text.lower()):
+            return ["I'm having trouble understanding. Could you please repeat your question more clearly?"]
         
-        query_emb = embedder.encode([question_text])
-        results = collection.query(
-            query_embeddings=query_emb.tolist(),
-            n_results=top_k
-        )
+        if not answer_texts:
+            return ["No answer found."]
         
-        answers = []
-        for i in range(len(results["metadatas"][0])):
-            answer = results["metadatas"][0][i].get("answer", "No answer found.")
-            answers.append(answer)
-        return answers
+        with torch.inference_mode():
+            query_emb = embedder.encode([question_text], convert_to_numpy=True, normalize_embeddings=True)
+        scores = question_embeddings @ query_emb[0].astype(np.float32)
+        if top_k == 1:
+            return [answer_texts[int(np.argmax(scores))]]
+        best = np.argsort(-scores)[:top_k]
+        return [answer_texts[i] for i in best]
 
     # Play greeting message
     print('\n--- Voice Assistant Ready ---')
@@ -213,21 +287,36 @@ def run_voice_assistant(collection, embedder):
     
     # Speak the greeting
     print("Playing greeting message...")
-    speak_text_sync(GREETING_MESSAGE)
+    say(GREETING_MESSAGE)
 
     try:
         with sd.RawInputStream(
             samplerate=SAMPLE_RATE,
-            blocksize=8000,
+            blocksize=BLOCK_SIZE,
             device=None,
             dtype='int16',
             channels=1,
             callback=audio_callback
         ):
             recognizer = vosk.KaldiRecognizer(vosk_model, SAMPLE_RATE)
+            was_speaking = False
+            last_partial_print = 0.0
 
             while True:
-                data = q_audio.get()
+                if speaking.is_set():
+                    q_audio.clear()
+                    was_speaking = True
+                    time.sleep(0.05)
+                    continue
+                if was_speaking:
+                    # Drop the tail of the reply's echo and decode the next question from scratch
+                    q_audio.clear()
+                    recognizer.Reset()
+                    was_speaking = False
+                data = q_audio.pop()
+                if data is None:
+                    time.sleep(0.05)
+                    continue
                 if recognizer.AcceptWaveform(data):
                     result_json = json.loads(recognizer.Result())
                     text = result_json.get('text', '').strip()
@@ -236,32 +325,50 @@ def run_voice_assistant(collection, embedder):
                         answers = query_chroma_db(text, top_k=1)
                         reply = answers[0]
                         print(f"Answer: {reply}")
-                        speak_text_sync(reply)
+                        say(reply)
+                    # Start the next utterance from a clean decoder state
+                    recognizer.Reset()
                 else:
                     partial_json = json.loads(recognizer.PartialResult())
                     partial = partial_json.get('partial', '')
-                    if partial:
+                    now = time.monotonic()
+                    # Console writes are slow on Windows - cap partial updates at ~10 per second
+                    if partial and now - last_partial_print >= PARTIAL_PRINT_INTERVAL:
                         print(f"Listening: {partial}", end='\r')
+                        last_partial_print = now
 
     except KeyboardInterrupt:
         print('\nVoice assistant stopped by user.')
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        speaker.shutdown(wait=False, cancel_futures=True)
+        if synthesis is not None:
+            synthesis.cancel()
+        tts_loop.call_soon_threadsafe(tts_loop.stop)
 
 
 def main():
+    # Open the audio device once rather than per reply
+    pygame.mixer.init(frequency=MIXER_FREQUENCY, size=-16, channels=2, buffer=MIXER_BUFFER)
+
     client = chromadb.Client(
         chromadb.config.Settings(
             persist_directory=PERSIST_DIRECTORY
         )
     )
-    embedder = SentenceTransformer('all-MiniLM-L6-v2')
+    embedder = load_embedder()
+    # Pay for kernel selection and buffer allocation now, not on the user's first question
+    embedder.eval()
+    with torch.inference_mode():
+        embedder.encode(["warmup"] * 4)
 
     collection = get_existing_collection(client)
     if collection is None:
         collection = upload_excel_to_chroma(client, embedder)
 
     run_voice_assistant(collection, embedder)
+    pygame.mixer.quit()
 
 
 if __name__ == "__main__":